@@ -1,5 +1,6 @@
 """Configuration via environment variables."""
 import os
+from functools import lru_cache
 from pathlib import Path
 
 # LLM backend (any OpenAI-compatible API)
@@ -31,6 +32,7 @@ SESSION_TTL = 86400  # 24h
 # System prompt
 PROMPTS_DIR = Path(__file__).parent / "prompts"
 
+@lru_cache(maxsize=8)
 def load_system_prompt(client: str = "default") -> str:
     path = PROMPTS_DIR / f"{client}.txt"
     if not path.exists():
@@ -18,13 +18,17 @@ INPUT_BLOCKED = [
     "root access", "admin access", "sudo",
 ]
 
+# Compiled once — a single C-level alternation scan instead of one
+# `pattern in text.lower()` pass per blocklist entry.
+_INPUT_RE = re.compile("|".join(re.escape(p) for p in INPUT_BLOCKED), re.IGNORECASE)
+
+
 def check_input(text: str) -> str | None:
     """Return blocked message or None if clean."""
-    lower = text.lower()
-    for pattern in INPUT_BLOCKED:
-        if pattern in lower:
-            logger.warning(f"INPUT GUARDRAIL triggered: '{pattern}' in message")
-            return SAFE_RESPONSE
+    m = _INPUT_RE.search(text)
+    if m:
+        logger.warning(f"INPUT GUARDRAIL triggered: '{m.group(0).lower()}' in message")
+        return SAFE_RESPONSE
     return None
 
 # ── OUTPUT GUARDRAILS ──
@@ -36,16 +40,21 @@ LEAK_PATTERNS = [
     "critical language rule", "absolute rules", "non-negotiable",
 ]
 
+_LEAK_RE = re.compile("|".join(re.escape(p) for p in LEAK_PATTERNS), re.IGNORECASE)
+
 def sanitise_chunk(text: str) -> str:
     """Strip CJK characters from a streaming chunk (useful for multilingual models)."""
+    # Fast path: pure-ASCII chunks (the overwhelming majority) can't contain
+    # CJK, so skip the regex entirely. str.isascii() is a single C-level scan.
+    if text.isascii():
+        return text
     return CJK_RE.sub('', text)
 
 def check_output_final(text: str) -> str:
     """Check completed response for prompt leaks. Returns sanitised text."""
     clean = CJK_RE.sub('', text)
-    lower = clean.lower()
-    for pattern in LEAK_PATTERNS:
-        if pattern in lower:
-            logger.warning(f"OUTPUT GUARDRAIL triggered: '{pattern}' in response")
-            return SAFE_RESPONSE
+    m = _LEAK_RE.search(clean)
+    if m:
+        logger.warning(f"OUTPUT GUARDRAIL triggered: '{m.group(0).lower()}' in response")
+        return SAFE_RESPONSE
     return clean
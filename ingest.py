@@ -18,17 +18,26 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(mess
 logger = logging.getLogger("ingest")
 
 
+_enc = None
+
+def _get_enc():
+    global _enc
+    if _enc is None:
+        import tiktoken
+        _enc = tiktoken.get_encoding("cl100k_base")
+    return _enc
+
+
 def chunk_text(text: str, chunk_size: int = 512, overlap: int = 50) -> list[str]:
-    """Split text into chunks by approximate token count (words as proxy)."""
-    words = text.split()
-    chunks = []
-    i = 0
-    while i < len(words):
-        chunk = " ".join(words[i:i + chunk_size])
-        if chunk.strip():
-            chunks.append(chunk.strip())
-        i += chunk_size - overlap
-    return chunks
+    """Split text into chunks of `chunk_size` BPE tokens with `overlap` tokens
+    of overlap (cl100k_base, matching the budgeting in tokens.py)."""
+    enc = _get_enc()
+    toks = enc.encode_ordinary(text)
+    if not toks:
+        return []
+    step = chunk_size - overlap
+    slices = [toks[i:i + chunk_size] for i in range(0, len(toks), step)]
+    return [c for c in (t.strip() for t in enc.decode_batch(slices)) if c]
 
 
 def read_file(path: Path) -> str:
@@ -60,6 +69,14 @@ def get_files(path: Path) -> list[Path]:
     return sorted(f for f in path.rglob("*") if f.suffix.lower() in exts and f.is_file())
 
 
+def read_and_chunk(path: Path, chunk_size: int, overlap: int) -> list[str]:
+    """Worker for parallel ingest: read one file and chunk its text."""
+    text = read_file(path)
+    if not text.strip():
+        return []
+    return chunk_text(text, chunk_size, overlap)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Ingest documents into the RAG knowledge base")
     parser.add_argument("--path", required=True, help="File or directory to ingest")
@@ -80,48 +97,72 @@ def main():
 
     logger.info(f"Found {len(files)} file(s) to ingest")
 
+    # Pass 1: read and chunk all files, in parallel — PDF text extraction is
+    # CPU-bound and the slowest stage for PDF-heavy corpora. Done before the
+    # model loads so the workers don't fork a copy of its weights.
+    from concurrent.futures import ProcessPoolExecutor
+    from itertools import repeat
+
+    rows: list[tuple[int, int, str]] = []  # (file_idx, chunk_idx, text)
+    with ProcessPoolExecutor() as ex:
+        results = ex.map(
+            read_and_chunk, files,
+            repeat(args.chunk_size), repeat(args.overlap),
+            chunksize=4,
+        )
+        for fi, chunks in enumerate(results):
+            if not chunks:
+                logger.warning(f"Skipping empty file: {files[fi].name}")
+                continue
+            logger.info(f"{files[fi].name}: {len(chunks)} chunks")
+            rows.extend((fi, ci, chunk) for ci, chunk in enumerate(chunks))
+
     # Load embedding model
     from sentence_transformers import SentenceTransformer
     model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
 
     # Connect to DB
-    import psycopg2
-    conn = psycopg2.connect(
+    import psycopg
+    from psycopg.types.json import Json
+    from pgvector.psycopg import HalfVector, register_vector
+
+    conn = psycopg.connect(
         host=os.getenv("RAG_DB_HOST", "localhost"),
         port=int(os.getenv("RAG_DB_PORT", "5432")),
         user=os.getenv("RAG_DB_USER", "postgres"),
         password=os.getenv("RAG_DB_PASS", "postgres"),
         dbname=os.getenv("RAG_DB_NAME", "agentic_rag"),
     )
-
-    total_chunks = 0
-    for f in files:
-        logger.info(f"Processing: {f.name}")
-        text = read_file(f)
-        if not text.strip():
-            logger.warning(f"  Skipping empty file: {f.name}")
-            continue
-
-        chunks = chunk_text(text, args.chunk_size, args.overlap)
-        logger.info(f"  {len(chunks)} chunks")
-
-        # Batch embed
-        embeddings = model.encode(chunks, normalize_embeddings=True, show_progress_bar=False)
-
-        with conn.cursor() as cur:
-            for i, (chunk, emb) in enumerate(zip(chunks, embeddings)):
-                metadata = {"source": args.source, "file": f.name, "chunk": i}
-                cur.execute(
-                    "INSERT INTO documents (content, metadata, embedding) VALUES (%s, %s, %s::vector)",
-                    (chunk, psycopg2.extras.Json(metadata), emb.tolist()),
-                )
-        conn.commit()
-        total_chunks += len(chunks)
+    register_vector(conn)
+
+    # Pass 2: embed everything in one call — small files no longer waste
+    # a forward pass on tiny batches. Sorting by length before encoding
+    # packs mini-batches tighter (less padding to the longest sentence).
+    order = sorted(range(len(rows)), key=lambda i: len(rows[i][2]))
+    embeddings = model.encode(
+        [rows[i][2] for i in order],
+        batch_size=64, normalize_embeddings=True, show_progress_bar=False,
+    )
+    emb_by_row = [None] * len(rows)
+    for pos, i in enumerate(order):
+        emb_by_row[i] = embeddings[pos]
+
+    # Pass 3: one binary COPY for the whole corpus — embeddings go over the
+    # wire straight from the numpy buffers, no per-row text formatting
+    with conn.cursor() as cur:
+        with cur.copy(
+            "COPY documents (content, metadata, embedding) FROM STDIN WITH (FORMAT BINARY)"
+        ) as cp:
+            cp.set_types(["text", "jsonb", "halfvec"])
+            for (fi, ci, chunk), emb in zip(rows, emb_by_row):
+                metadata = {"source": args.source, "file": files[fi].name, "chunk": ci}
+                cp.write_row((chunk, Json(metadata), HalfVector(emb)))
+    conn.commit()
+    total_chunks = len(rows)
 
     conn.close()
     logger.info(f"Done! Ingested {total_chunks} chunks from {len(files)} files.")
 
 
 if __name__ == "__main__":
-    import psycopg2.extras
     main()
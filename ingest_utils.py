@@ -13,46 +13,62 @@ SUPPORTED_TYPES = {".pdf", ".txt", ".md", ".docx", ".csv"}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 
 
+_enc = None
+
+def _get_enc():
+    global _enc
+    if _enc is None:
+        import tiktoken
+        _enc = tiktoken.get_encoding("cl100k_base")
+    return _enc
+
+
 def chunk_text(text: str, chunk_size: int = 512, overlap: int = 50) -> list[str]:
-    """Split text into chunks by approximate token count (words as proxy)."""
-    words = text.split()
-    chunks = []
-    i = 0
-    while i < len(words):
-        chunk = " ".join(words[i:i + chunk_size])
-        if chunk.strip():
-            chunks.append(chunk.strip())
-        i += chunk_size - overlap
-    return chunks
-
-
-def extract_text(filename: str, content: bytes) -> str:
-    """Extract text from file bytes based on extension."""
+    """Split text into chunks of `chunk_size` BPE tokens with `overlap` tokens
+    of overlap — one encode pass plus cheap slicing, and the sizes line up
+    with the cl100k_base budgeting done in tokens.py."""
+    enc = _get_enc()
+    toks = enc.encode_ordinary(text)
+    if not toks:
+        return []
+    step = chunk_size - overlap
+    slices = [toks[i:i + chunk_size] for i in range(0, len(toks), step)]
+    return [c for c in (t.strip() for t in enc.decode_batch(slices)) if c]
+
+
+def extract_text(filename: str, fileobj) -> str:
+    """Extract text from a binary file-like object based on extension.
+
+    Parsers that accept file-likes (pdfplumber, PyPDF2, python-docx) read from
+    the handle directly, so large uploads are never copied into a bytes blob.
+    """
     ext = os.path.splitext(filename)[1].lower()
+    if isinstance(fileobj, bytes):
+        fileobj = io.BytesIO(fileobj)
 
     if ext in (".txt", ".md"):
-        return content.decode("utf-8", errors="replace")
+        return fileobj.read().decode("utf-8", errors="replace")
 
     elif ext == ".pdf":
         try:
             import pdfplumber
-            with pdfplumber.open(io.BytesIO(content)) as pdf:
+            with pdfplumber.open(fileobj) as pdf:
                 return "\n".join(p.extract_text() or "" for p in pdf.pages)
         except ImportError:
             try:
                 from PyPDF2 import PdfReader
-                reader = PdfReader(io.BytesIO(content))
+                reader = PdfReader(fileobj)
                 return "\n".join(page.extract_text() or "" for page in reader.pages)
             except ImportError:
                 raise RuntimeError("No PDF library available")
 
     elif ext == ".docx":
         from docx import Document
-        doc = Document(io.BytesIO(content))
+        doc = Document(fileobj)
         return "\n".join(p.text for p in doc.paragraphs)
 
     elif ext == ".csv":
-        text = content.decode("utf-8", errors="replace")
+        text = fileobj.read().decode("utf-8", errors="replace")
         reader = csv.reader(io.StringIO(text))
         rows = list(reader)
         if not rows:
@@ -69,9 +85,9 @@ def extract_text(filename: str, content: bytes) -> str:
 
 
 def embed_and_store(text: str, source: str, file_type: str) -> int:
-    """Chunk text, embed on CPU, store in pgvector. Returns chunk count."""
-    import psycopg2
-    import psycopg2.extras
+    """Chunk text, embed on CPU, store in pgvector via COPY. Returns chunk count."""
+    from psycopg.types.json import Json
+    from pgvector.psycopg import HalfVector, register_vector
     import rag
 
     chunks = chunk_text(text)
@@ -81,23 +97,27 @@ def embed_and_store(text: str, source: str, file_type: str) -> int:
     model = rag._get_model()
     embeddings = model.encode(chunks, normalize_embeddings=True, show_progress_bar=False)
 
-    conn = rag._get_conn()
-    try:
+    upload_time = datetime.now(timezone.utc).isoformat()
+    with rag._get_conn() as conn:
+        register_vector(conn)
         with conn.cursor() as cur:
-            for i, (chunk, emb) in enumerate(zip(chunks, embeddings)):
-                metadata = {
-                    "source": source,
-                    "file_type": file_type,
-                    "upload_time": datetime.now(timezone.utc).isoformat(),
-                    "chunk": i,
-                }
-                cur.execute(
-                    "INSERT INTO documents (content, metadata, embedding) VALUES (%s, %s, %s::vector)",
-                    (chunk, psycopg2.extras.Json(metadata), emb.tolist()),
-                )
+            # COPY streams all rows in one round trip instead of one INSERT per
+            # chunk; binary format sends the float buffers straight from numpy
+            # instead of formatting 384 floats per row as text.
+            with cur.copy(
+                "COPY documents (content, metadata, embedding) FROM STDIN WITH (FORMAT BINARY)"
+            ) as cp:
+                cp.set_types(["text", "jsonb", "halfvec"])
+                for i, (chunk, emb) in enumerate(zip(chunks, embeddings)):
+                    metadata = {
+                        "source": source,
+                        "file_type": file_type,
+                        "upload_time": upload_time,
+                        "chunk": i,
+                    }
+                    cp.write_row((chunk, Json(metadata), HalfVector(emb)))
         conn.commit()
-    finally:
-        conn.close()
 
+    rag.invalidate_cache()
     logger.info(f"Stored {len(chunks)} chunks from {source}")
     return len(chunks)
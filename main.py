@@ -1,10 +1,12 @@
 """Agentic RAG Chat — FastAPI SSE streaming proxy to any OpenAI-compatible LLM."""
-import json
 import time
+import asyncio
 import logging
+from collections import defaultdict, deque
 from contextlib import asynccontextmanager
 
 import httpx
+import orjson
 import uvicorn
 from fastapi import FastAPI, Request, HTTPException, Depends, UploadFile, Form
 from fastapi.middleware.cors import CORSMiddleware
@@ -19,18 +21,26 @@ import tokens
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
 logger = logging.getLogger("agent")
 
-# Rate limit store (IP-based, in-memory)
-_ip_hits: dict[str, list[float]] = {}
+# Rate limit store (IP-based, in-memory). Each IP gets a deque bounded at the
+# window size, so a check is O(1) instead of rebuilding the hit list per call.
+_ip_hits: dict[str, deque] = defaultdict(lambda: deque(maxlen=config.RATE_LIMIT_PER_MIN))
 
 def check_ip_rate(ip: str) -> bool:
     now = time.time()
-    hits = _ip_hits.setdefault(ip, [])
-    hits[:] = [t for t in hits if now - t < 60]
-    if len(hits) >= config.RATE_LIMIT_PER_MIN:
+    hits = _ip_hits[ip]
+    if len(hits) == hits.maxlen and now - hits[0] < 60:
         return False
     hits.append(now)
     return True
 
+async def _sweep_ip_hits(interval: float = 600):
+    """Evict IPs with no hits in the last `interval` seconds, so the store stays bounded."""
+    while True:
+        await asyncio.sleep(interval)
+        cutoff = time.time() - interval
+        for ip in [ip for ip, d in _ip_hits.items() if not d or d[-1] < cutoff]:
+            del _ip_hits[ip]
+
 # Auth dependency
 async def verify_api_key(request: Request):
     auth = request.headers.get("Authorization", "")
@@ -43,7 +53,14 @@ async def verify_api_key(request: Request):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Agentic RAG Chat starting on port %s", config.PORT)
+    import rag
+    if rag.RAG_ENABLED:
+        rag._get_pool()  # open the Postgres pool before the first request
+    sweeper = asyncio.create_task(_sweep_ip_hits())
     yield
+    sweeper.cancel()
+    await rag.aclose_pool()
+    rag.close_pool()
     logger.info("Agentic RAG Chat shutting down")
 
 app = FastAPI(title="Agentic RAG Chat", lifespan=lifespan)
@@ -88,14 +105,19 @@ async def upload_document(file: UploadFile, source: str = Form(default=None)):
     if ext not in ingest_utils.SUPPORTED_TYPES:
         raise HTTPException(400, f"Unsupported file type: {ext}. Supported: pdf, txt, md, docx, csv")
 
-    content = await file.read()
-    if len(content) > ingest_utils.MAX_FILE_SIZE:
+    # Starlette already spools the upload to a temp file; hand that file-like
+    # straight to the parsers instead of copying the payload into memory
+    upload = file.file
+    upload.seek(0, os.SEEK_END)
+    size = upload.tell()
+    upload.seek(0)
+    if size > ingest_utils.MAX_FILE_SIZE:
         raise HTTPException(400, "File too large (max 50MB)")
-    if not content:
+    if size == 0:
         raise HTTPException(400, "Empty file")
 
     try:
-        text = ingest_utils.extract_text(filename, content)
+        text = ingest_utils.extract_text(filename, upload)
     except Exception as e:
         logger.error(f"Text extraction failed for {filename}: {e}")
         raise HTTPException(422, f"Could not extract text: {e}")
@@ -122,8 +144,7 @@ async def upload_document(file: UploadFile, source: str = Form(default=None)):
 async def list_files():
     """List all indexed documents in the RAG knowledge base."""
     import rag
-    conn = rag._get_conn()
-    try:
+    with rag._get_conn() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT metadata->>'source' as source,
@@ -135,8 +156,6 @@ async def list_files():
                 ORDER BY uploaded DESC NULLS LAST, source
             """)
             rows = cur.fetchall()
-    finally:
-        conn.close()
     return {
         "files": [
             {"source": r[0], "file_type": r[1] or "", "chunks": r[2], "uploaded": r[3]}
@@ -159,8 +178,8 @@ async def chat(req: ChatRequest, request: Request):
             chunk = {
                 "choices": [{"delta": {"content": blocked}, "index": 0, "finish_reason": None}]
             }
-            yield f"data: {json.dumps(chunk)}\n\n"
-            yield "data: [DONE]\n\n"
+            yield b"data: " + orjson.dumps(chunk) + b"\n\n"
+            yield b"data: [DONE]\n\n"
         return StreamingResponse(blocked_stream(), media_type="text/event-stream")
 
     # Session
@@ -186,7 +205,7 @@ async def chat(req: ChatRequest, request: Request):
     # RAG: inject relevant documentation context
     try:
         import rag
-        rag_context = rag.build_context(req.message)
+        rag_context = await rag.abuild_context(req.message)
         if rag_context:
             system_prompt = system_prompt + rag_context
             logger.info("RAG context injected (%d chars)", len(rag_context))
@@ -195,8 +214,10 @@ async def chat(req: ChatRequest, request: Request):
 
     history = await tokens.trim_history(system_prompt, history)
 
-    # Build messages
-    messages = [{"role": "system", "content": system_prompt}] + history
+    # Build messages (drop internal fields like _tok before sending upstream)
+    messages = [{"role": "system", "content": system_prompt}] + [
+        {"role": m["role"], "content": m["content"]} for m in history
+    ]
 
     # Save user message
     await sessions.append_message(sid, "user", req.message)
@@ -222,34 +243,42 @@ async def chat(req: ChatRequest, request: Request):
                         error_body = await resp.aread()
                         logger.error(f"LLM error {resp.status_code}: {error_body[:500]}")
                         err = {"choices": [{"delta": {"content": "Error connecting to AI model."}, "index": 0, "finish_reason": None}]}
-                        yield f"data: {json.dumps(err)}\n\n"
-                        yield "data: [DONE]\n\n"
+                        yield b"data: " + orjson.dumps(err) + b"\n\n"
+                        yield b"data: [DONE]\n\n"
                         return
 
+                    sid_sent = False
                     async for line in resp.aiter_lines():
                         if not line.startswith("data: "):
                             continue
                         if line == "data: [DONE]":
-                            yield "data: [DONE]\n\n"
+                            yield b"data: [DONE]\n\n"
                             break
 
                         try:
-                            data = json.loads(line[6:])
+                            data = orjson.loads(line[6:])
                             delta = data.get("choices", [{}])[0].get("delta", {}).get("content", "")
                             if delta:
                                 clean = guardrails.sanitise_chunk(delta)
                                 full_text += clean
-                                if clean:
+                                if not clean:
+                                    continue
+                                if sid_sent and clean == delta:
+                                    # Delta unchanged and session_id already delivered:
+                                    # forward the upstream frame without re-serialising
+                                    yield line.encode() + b"\n\n"
+                                else:
                                     data["choices"][0]["delta"]["content"] = clean
                                     data["session_id"] = sid
-                                    yield f"data: {json.dumps(data)}\n\n"
-                        except json.JSONDecodeError:
+                                    yield b"data: " + orjson.dumps(data) + b"\n\n"
+                                    sid_sent = True
+                        except orjson.JSONDecodeError:
                             continue
         except Exception as e:
             logger.error(f"Stream error: {e}")
             err = {"choices": [{"delta": {"content": "Connection error. Please try again."}, "index": 0, "finish_reason": None}]}
-            yield f"data: {json.dumps(err)}\n\n"
-            yield "data: [DONE]\n\n"
+            yield b"data: " + orjson.dumps(err) + b"\n\n"
+            yield b"data: [DONE]\n\n"
 
         # Output guardrail on full text
         final = guardrails.check_output_final(full_text)
@@ -1,7 +1,11 @@
 """RAG module — CPU-only embedding + pgvector retrieval."""
 import os
 import time
+import asyncio
 import logging
+from contextlib import contextmanager
+from functools import lru_cache
+
 import numpy as np
 
 logger = logging.getLogger("agent.rag")
@@ -9,6 +13,8 @@ logger = logging.getLogger("agent.rag")
 RAG_ENABLED = os.getenv("RAG_ENABLED", "true").lower() == "true"
 RAG_TOP_K = int(os.getenv("RAG_TOP_K", "5"))
 RAG_MIN_SIMILARITY = float(os.getenv("RAG_MIN_SIMILARITY", "0.3"))
+# Directory with an ONNX export of the embedding model (see `make export-onnx`).
+RAG_ONNX_MODEL = os.getenv("RAG_ONNX_MODEL", "models/minilm-onnx-int8")
 
 DB_HOST = os.getenv("RAG_DB_HOST", "localhost")
 DB_PORT = int(os.getenv("RAG_DB_PORT", "5432"))
@@ -18,6 +24,45 @@ DB_NAME = os.getenv("RAG_DB_NAME", "agentic_rag")
 
 _model = None
 _pool = None
+_apool = None
+
+
+class _OnnxEncoder:
+    """Minimal SentenceTransformer.encode-compatible wrapper around an
+    int8-quantized ONNX Runtime session (mean pooling + L2 normalise)."""
+
+    def __init__(self, path: str):
+        import glob
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        onnx_files = sorted(glob.glob(os.path.join(path, "*.onnx")))
+        if not onnx_files:
+            raise FileNotFoundError(f"No .onnx model found in {path}")
+        # Prefer the quantized export if both are present
+        model_file = next((f for f in onnx_files if "quantized" in f), onnx_files[0])
+
+        opts = onnxruntime.SessionOptions()
+        opts.intra_op_num_threads = os.cpu_count() or 1
+        self.session = onnxruntime.InferenceSession(model_file, sess_options=opts)
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts, batch_size: int = 64, normalize_embeddings: bool = True, **_):
+        parts = []
+        for i in range(0, len(texts), batch_size):
+            tok = self.tokenizer(
+                texts[i:i + batch_size],
+                padding=True, truncation=True, max_length=256, return_tensors="np",
+            )
+            feed = {k: v for k, v in tok.items() if k in self._input_names}
+            hidden = self.session.run(None, feed)[0]
+            mask = tok["attention_mask"][:, :, None].astype(hidden.dtype)
+            parts.append((hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9))
+        emb = np.concatenate(parts).astype(np.float32)
+        if normalize_embeddings:
+            emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+        return emb
 
 
 def _get_model():
@@ -26,61 +71,221 @@ def _get_model():
         os.environ["CUDA_VISIBLE_DEVICES"] = ""
         os.environ["HF_HUB_OFFLINE"] = "1"
         os.environ["TRANSFORMERS_OFFLINE"] = "1"
+        if os.path.isdir(RAG_ONNX_MODEL):
+            try:
+                _model = _OnnxEncoder(RAG_ONNX_MODEL)
+                logger.info("Loaded int8 ONNX embedding model (CPU)")
+                return _model
+            except Exception as e:
+                logger.warning(f"ONNX model unavailable ({e}), falling back to PyTorch")
         from sentence_transformers import SentenceTransformer
         _model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
         logger.info("Loaded embedding model (CPU)")
     return _model
 
 
-def embed(text: str) -> list[float]:
-    """Embed a single text string, returns list of 384 floats."""
+def embed(text: str) -> np.ndarray:
+    """Embed a single text string, returns a float32 array of 384 floats."""
     model = _get_model()
-    vec = model.encode([text], normalize_embeddings=True)[0]
-    return vec.tolist()
+    return model.encode([text], normalize_embeddings=True)[0]
+
+
+def vector_literal(vec) -> str:
+    """Format an embedding as the pgvector text form '[f1,f2,...]'."""
+    return "[" + ",".join(f"{x:.7g}" for x in vec) + "]"
+
+
+def _conninfo() -> str:
+    return (
+        f"host={DB_HOST} port={DB_PORT} "
+        f"user={DB_USER} password={DB_PASS} dbname={DB_NAME}"
+    )
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        from psycopg_pool import ConnectionPool
+        _pool = ConnectionPool(
+            conninfo=_conninfo(),
+            min_size=2, max_size=16,
+            kwargs={"prepare_threshold": 0},
+        )
+        logger.info("Opened Postgres connection pool")
+    return _pool
+
+
+_apool_lock = asyncio.Lock()
+
 
+async def _get_apool():
+    global _apool
+    if _apool is None:
+        async with _apool_lock:
+            if _apool is None:
+                from psycopg_pool import AsyncConnectionPool
+                pool = AsyncConnectionPool(
+                    conninfo=_conninfo(),
+                    min_size=1, max_size=8,
+                    kwargs={"prepare_threshold": 0},
+                    open=False,
+                )
+                await pool.open()
+                logger.info("Opened async Postgres connection pool")
+                # Publish only once opened, so concurrent first requests
+                # never see a pool that isn't ready yet
+                _apool = pool
+    return _apool
 
+
+@contextmanager
 def _get_conn():
-    import psycopg2
-    return psycopg2.connect(
-        host=DB_HOST, port=DB_PORT,
-        user=DB_USER, password=DB_PASS,
-        dbname=DB_NAME,
+    """Borrow a pooled connection; returned to the pool on exit."""
+    with _get_pool().connection() as conn:
+        yield conn
+
+
+def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+async def aclose_pool():
+    global _apool
+    if _apool is not None:
+        await _apool.close()
+        _apool = None
+
+
+@lru_cache(maxsize=2048)
+def _embed_cached(query_norm: str) -> tuple[float, ...]:
+    """Cached single-query embedding — repeated questions skip the forward pass."""
+    return tuple(embed(query_norm))
+
+
+# Result cache shared by the sync and async search paths (FIFO eviction).
+# Entries expire after a TTL: CLI ingests (ingest.py) write straight to
+# Postgres without calling invalidate_cache(), so without one a popular query
+# would serve stale context until restart.
+_SEARCH_CACHE_MAX = 2048
+_SEARCH_CACHE_TTL = 300  # seconds
+_search_cache: dict[tuple, tuple] = {}  # key -> (expires_at, rows)
+
+# The query vector is bound once (as a pgvector text literal) and fanned out
+# through a CTE, instead of being serialised as a parameter four times over.
+_SEARCH_SQL = """
+    WITH q AS (SELECT %s::halfvec AS v)
+    SELECT content, metadata, 1 - (embedding <=> q.v) as similarity
+    FROM documents, q
+    WHERE 1 - (embedding <=> q.v) >= %s
+    ORDER BY embedding <=> q.v
+    LIMIT %s
+"""
+
+
+# Scoped to the current transaction (set_config(..., true) == SET LOCAL),
+# so pooled connections don't leak the setting between requests.
+_EF_SEARCH_SQL = "SELECT set_config('hnsw.ef_search', %s, true)"
+
+
+def _ef_search(top_k: int) -> int:
+    """HNSW candidate-list size: wider than top_k for recall, floor of 40."""
+    return max(top_k * 4, 40)
+
+
+def _cache_get(key: tuple) -> tuple | None:
+    hit = _search_cache.get(key)
+    if hit is None:
+        return None
+    expires_at, rows = hit
+    if time.time() >= expires_at:
+        _search_cache.pop(key, None)
+        return None
+    return rows
+
+
+def _cache_put(key: tuple, rows: tuple):
+    if len(_search_cache) >= _SEARCH_CACHE_MAX:
+        _search_cache.pop(next(iter(_search_cache)))
+    _search_cache[key] = (time.time() + _SEARCH_CACHE_TTL, rows)
+
+
+def invalidate_cache():
+    """Drop cached search results; call after new documents are ingested."""
+    _search_cache.clear()
+
+
+def _rows_to_results(rows) -> tuple[dict, ...]:
+    return tuple(
+        {"content": r[0], "metadata": r[1], "similarity": float(r[2])}
+        for r in rows
     )
 
 
 def search(query: str, top_k: int = None, min_similarity: float = None) -> list[dict]:
-    """Embed query and search pgvector for similar chunks."""
+    """Embed query and search pgvector for similar chunks. Results are cached
+    per normalised query, so popular questions skip both embed and KNN."""
     if top_k is None:
         top_k = RAG_TOP_K
     if min_similarity is None:
         min_similarity = RAG_MIN_SIMILARITY
 
-    t0 = time.time()
-    vec = embed(query)
-    t_embed = time.time() - t0
+    query_norm = query.strip().lower()
+    key = (query_norm, top_k, min_similarity)
+    cached = _cache_get(key)
+    if cached is None:
+        t0 = time.time()
+        vec_lit = vector_literal(_embed_cached(query_norm))
+        t_embed = time.time() - t0
 
-    t1 = time.time()
-    conn = _get_conn()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT content, metadata, 1 - (embedding <=> %s::vector) as similarity
-                FROM documents
-                WHERE 1 - (embedding <=> %s::vector) >= %s
-                ORDER BY embedding <=> %s::vector
-                LIMIT %s
-            """, (vec, vec, min_similarity, vec, top_k))
-            rows = cur.fetchall()
-    finally:
-        conn.close()
-
-    t_search = time.time() - t1
-    logger.info(f"RAG: embed={t_embed*1000:.0f}ms search={t_search*1000:.0f}ms results={len(rows)}")
-
-    return [
-        {"content": r[0], "metadata": r[1], "similarity": float(r[2])}
-        for r in rows
-    ]
+        t1 = time.time()
+        with _get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(_EF_SEARCH_SQL, (str(_ef_search(top_k)),))
+                cur.execute(_SEARCH_SQL, (vec_lit, min_similarity, top_k))
+                rows = cur.fetchall()
+        t_search = time.time() - t1
+
+        logger.info(f"RAG: embed={t_embed*1000:.0f}ms search={t_search*1000:.0f}ms results={len(rows)}")
+        cached = _rows_to_results(rows)
+        _cache_put(key, cached)
+
+    # Shallow-copy so callers can't mutate the cached entries
+    return [dict(r) for r in cached]
+
+
+async def asearch(query: str, top_k: int = None, min_similarity: float = None) -> list[dict]:
+    """Async variant of search(): embedding runs in a worker thread and the
+    KNN query goes through the async pool, so the event loop never blocks."""
+    if top_k is None:
+        top_k = RAG_TOP_K
+    if min_similarity is None:
+        min_similarity = RAG_MIN_SIMILARITY
+
+    query_norm = query.strip().lower()
+    key = (query_norm, top_k, min_similarity)
+    cached = _cache_get(key)
+    if cached is None:
+        t0 = time.time()
+        vec_lit = vector_literal(await asyncio.to_thread(_embed_cached, query_norm))
+        t_embed = time.time() - t0
+
+        t1 = time.time()
+        pool = await _get_apool()
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(_EF_SEARCH_SQL, (str(_ef_search(top_k)),))
+                await cur.execute(_SEARCH_SQL, (vec_lit, min_similarity, top_k))
+                rows = await cur.fetchall()
+        t_search = time.time() - t1
+
+        logger.info(f"RAG: embed={t_embed*1000:.0f}ms search={t_search*1000:.0f}ms results={len(rows)}")
+        cached = _rows_to_results(rows)
+        _cache_put(key, cached)
+
+    return [dict(r) for r in cached]
 
 
 def build_context(query: str) -> str | None:
@@ -92,7 +297,22 @@ def build_context(query: str) -> str | None:
     except Exception as e:
         logger.error(f"RAG search failed: {e}")
         return None
+    return _format_context(results)
+
+
+async def abuild_context(query: str) -> str | None:
+    """Async variant of build_context() for use inside the event loop."""
+    if not RAG_ENABLED:
+        return None
+    try:
+        results = await asearch(query)
+    except Exception as e:
+        logger.error(f"RAG search failed: {e}")
+        return None
+    return _format_context(results)
+
 
+def _format_context(results: list[dict]) -> str | None:
     if not results:
         return None
 
@@ -1,8 +1,15 @@
-"""Redis session management with rate limiting."""
-import json
+"""Redis session management with rate limiting.
+
+Session metadata lives in a small hash (`agent:session:{sid}`) and the
+message history in a Redis LIST (`agent:session:{sid}:msgs`), so appending
+a message is an O(1) RPUSH+LTRIM instead of a GET/decode/append/encode/SET
+round trip over the whole history.
+"""
 import time
 import uuid
+import orjson
 import redis.asyncio as redis
+import tokens
 from config import REDIS_URL, SESSION_TTL, MAX_MESSAGES_PER_SESSION
 
 pool = redis.ConnectionPool.from_url(REDIS_URL, decode_responses=True)
@@ -13,60 +20,76 @@ def get_redis():
 def _key(session_id: str) -> str:
     return f"agent:session:{session_id}"
 
+def _msgs_key(session_id: str) -> str:
+    return f"agent:session:{session_id}:msgs"
+
 async def create_session() -> str:
     sid = uuid.uuid4().hex[:16]
     r = get_redis()
-    data = {"created": time.time(), "messages": []}
-    await r.set(_key(sid), json.dumps(data), ex=SESSION_TTL)
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.hset(_key(sid), "created", time.time())
+        pipe.expire(_key(sid), SESSION_TTL)
+        await pipe.execute()
     return sid
 
 async def get_session(session_id: str) -> dict | None:
     r = get_redis()
-    raw = await r.get(_key(session_id))
-    if raw is None:
+    try:
+        meta = await r.hgetall(_key(session_id))
+    except redis.ResponseError:
+        # Key left over from the old JSON-blob format (WRONGTYPE); treat the
+        # session as expired so the caller falls back to a fresh one
+        await r.delete(_key(session_id))
+        return None
+    if not meta:
         return None
-    return json.loads(raw)
+    return {"created": float(meta.get("created", 0))}
 
 async def get_history(session_id: str) -> list[dict]:
-    data = await get_session(session_id)
-    if data is None:
-        return []
-    return data.get("messages", [])
+    r = get_redis()
+    raw = await r.lrange(_msgs_key(session_id), 0, -1)
+    return [orjson.loads(m) for m in raw]
 
 async def append_message(session_id: str, role: str, content: str):
     r = get_redis()
-    key = _key(session_id)
-    data = await get_session(session_id)
-    if data is None:
+    if not await r.exists(_key(session_id)):
         return
-    msgs = data.get("messages", [])
-    msgs.append({"role": role, "content": content})
-    if len(msgs) > MAX_MESSAGES_PER_SESSION:
-        msgs = msgs[-MAX_MESSAGES_PER_SESSION:]
-    data["messages"] = msgs
-    await r.set(key, json.dumps(data), ex=SESSION_TTL)
+    # Store the token count with the message so trim_history sums ints
+    # instead of re-encoding the whole history every turn
+    msg = {"role": role, "content": content, "_tok": tokens.count_tokens(content)}
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.rpush(_msgs_key(session_id), orjson.dumps(msg))
+        pipe.ltrim(_msgs_key(session_id), -MAX_MESSAGES_PER_SESSION, -1)
+        pipe.expire(_key(session_id), SESSION_TTL)
+        pipe.expire(_msgs_key(session_id), SESSION_TTL)
+        await pipe.execute()
 
 async def set_history(session_id: str, messages: list[dict]):
     """Replace history (after summarisation)."""
     r = get_redis()
-    key = _key(session_id)
-    data = await get_session(session_id)
-    if data is None:
+    if not await r.exists(_key(session_id)):
         return
-    data["messages"] = messages
-    await r.set(key, json.dumps(data), ex=SESSION_TTL)
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.delete(_msgs_key(session_id))
+        if messages:
+            pipe.rpush(_msgs_key(session_id), *(orjson.dumps(m) for m in messages))
+            pipe.expire(_msgs_key(session_id), SESSION_TTL)
+        pipe.expire(_key(session_id), SESSION_TTL)
+        await pipe.execute()
 
 async def delete_session(session_id: str):
     r = get_redis()
-    await r.delete(_key(session_id))
+    await r.delete(_key(session_id), _msgs_key(session_id))
 
 async def session_info(session_id: str) -> dict | None:
     data = await get_session(session_id)
     if data is None:
         return None
+    r = get_redis()
+    count = await r.llen(_msgs_key(session_id))
     return {
         "session_id": session_id,
-        "message_count": len(data.get("messages", [])),
+        "message_count": count,
         "created": data.get("created"),
     }
 
@@ -1,5 +1,8 @@
 """Token counting and history trimming with automatic summarisation."""
+import asyncio
 import logging
+from functools import lru_cache
+
 import httpx
 import tiktoken
 from config import LLM_URL, LLM_API_KEY, LLM_MODEL, MAX_TOKENS_CONTEXT
@@ -7,13 +10,23 @@ from config import LLM_URL, LLM_API_KEY, LLM_MODEL, MAX_TOKENS_CONTEXT
 logger = logging.getLogger("agent.tokens")
 enc = tiktoken.get_encoding("cl100k_base")
 
+@lru_cache(maxsize=4096)
 def count_tokens(text: str) -> int:
     return len(enc.encode(text))
 
 def count_messages_tokens(messages: list[dict]) -> int:
     total = 0
+    uncounted = []
     for m in messages:
-        total += count_tokens(m.get("content", "")) + 4  # role overhead
+        # Prefer the count stored at append time
+        tok = m.get("_tok")
+        if tok:
+            total += tok + 4  # role overhead
+        else:
+            uncounted.append(m.get("content", ""))
+    if uncounted:
+        # One batch call — tiktoken runs the BPE passes in parallel in Rust
+        total += sum(len(toks) + 4 for toks in enc.encode_ordinary_batch(uncounted))
     return total
 
 async def summarise_messages(messages: list[dict]) -> str:
@@ -41,10 +54,11 @@ async def summarise_messages(messages: list[dict]) -> str:
 
 async def trim_history(system_prompt: str, messages: list[dict]) -> list[dict]:
     """Trim history to fit within token budget. Returns new message list."""
-    sys_tokens = count_tokens(system_prompt) + 4
+    sys_tokens = await asyncio.to_thread(count_tokens, system_prompt) + 4
     budget = MAX_TOKENS_CONTEXT - sys_tokens
 
-    if count_messages_tokens(messages) <= budget:
+    # Encoding runs in a worker thread so the event loop isn't blocked on BPE
+    if await asyncio.to_thread(count_messages_tokens, messages) <= budget:
         return messages
 
     logger.info("History exceeds token budget, summarising...")